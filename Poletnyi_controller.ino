@@ -32,6 +32,56 @@ struct MotorOutput {
   int esc1, esc2, esc3, esc4;
 } motors;
 
+// Последовательность команд, загруженная целиком с Raspberry Pi
+#define LOOP_PERIOD_US 4000
+#define SEQ_MAX_STEPS 32
+#define SEQ_MAX_STEP_MS 262140UL
+
+const char* const SEQ_COMMANDS[] = {
+  "TAKEOFF", "LAND", "HOVER", "STOP",
+  "FORWARD", "BACK", "LEFT", "RIGHT",
+  "UP", "DOWN", "ROTATE_LEFT", "ROTATE_RIGHT"
+};
+#define SEQ_COMMANDS_COUNT (sizeof(SEQ_COMMANDS) / sizeof(SEQ_COMMANDS[0]))
+
+struct Sequence {
+  byte commands[SEQ_MAX_STEPS];
+  unsigned long durations[SEQ_MAX_STEPS];
+  byte length = 0;
+  byte current = 0;
+  unsigned long step_start = 0;
+  bool active = false;
+} sequence;
+
+// Прием строки от Raspberry Pi по словам, без ожидания конца строки
+#define RPI_TOKEN_MAX 24
+
+struct LineParser {
+  char token[RPI_TOKEN_MAX];
+  byte token_len = 0;
+  byte token_index = 0;
+  char command[RPI_TOKEN_MAX];
+  bool seq_line = false;
+  const char* error = NULL;
+  long seq_expected = 0;
+  byte seq_count = 0;
+  unsigned long last_byte_ms = 0;
+} rpi_line;
+
+// Отчеты для Raspberry Pi. SoftwareSerial полудуплексный: передача байта
+// (~1 мс на 9600 бод) идет с запретом прерываний, и байты, пришедшие в это
+// время от Raspberry Pi, искажаются. Поэтому за цикл отправляется не больше
+// одного байта и только когда Raspberry Pi молчит RPI_IDLE_MS. Команду,
+// посланную одновременно с отчетом, это все равно не защищает полностью:
+// надежная связь требует аппаратного UART (Serial1 на Mega/Leonardo).
+#define REPORT_BUFFER_SIZE 64
+#define REPORT_RESERVE 18
+#define RPI_IDLE_MS 20
+char report_buffer[REPORT_BUFFER_SIZE];
+byte report_head = 0, report_tail = 0;
+
+bool queue_report(const char* text, byte reserve = 0);
+
 // Глобальные переменные
 unsigned long loop_timer;
 int16_t gyro_data[3], accel_data[3];
@@ -76,9 +126,14 @@ void loop() {
     if (rc.channels[0] < 1050 && rc.channels[1] < 1050 && 
         rc.channels[2] < 1050 && rc.channels[3] > 1950) {
       state.armed = true;
+      // Последовательность, загруженная до арминга, не запускается
+      abort_sequence();
       Serial.println("Дрон включен");
     }
   } else {
+    // Шаги загруженной последовательности сменяются по millis()
+    update_sequence();
+    
     // Основной цикл полета
     if (state.voice_mode) {
       // Голосовое управление
@@ -102,6 +157,7 @@ void loop() {
         rc.channels[2] < 1050 && rc.channels[3] < 1050) {
       state.armed = false;
       state.voice_mode = false;
+      abort_sequence();
       Serial.println("Дрон выключен");
     }
   }
@@ -109,18 +165,198 @@ void loop() {
   // Отправка сигналов на ESC
   output_motor_signals();
   
+  // Один байт отчета для Raspberry Pi
+  flush_report_byte();
+  
   // Синхронизация цикла
-  while (micros() - loop_timer < 4000);
+  while (micros() - loop_timer < LOOP_PERIOD_US);
   loop_timer = micros();
 }
 
 // Обработка голосовых команд
 void check_voice_commands() {
-  if (rpiSerial.available()) {
-    String command = rpiSerial.readStringUntil('\n');
-    command.trim();
-    execute_voice_command(command);
+  // Читаются только уже принятые байты, цикл не ждет конца строки
+  while (rpiSerial.available()) {
+    char c = rpiSerial.read();
+    rpi_line.last_byte_ms = millis();
+    
+    if (c == ' ' || c == '\n') {
+      if (rpi_line.token_len > 0) {
+        rpi_line.token[rpi_line.token_len] = '\0';
+        process_token();
+        rpi_line.token_len = 0;
+        rpi_line.token_index++;
+      }
+      if (c == '\n') {
+        finish_line();
+      }
+    } else if (c != '\r') {
+      if (rpi_line.token_len < RPI_TOKEN_MAX - 1) {
+        rpi_line.token[rpi_line.token_len++] = c;
+      } else if (rpi_line.error == NULL) {
+        rpi_line.error = "SEQ_ERR FORMAT\n";
+      }
+    }
+  }
+}
+
+int find_sequence_command(const char* name) {
+  for (byte i = 0; i < SEQ_COMMANDS_COUNT; i++) {
+    if (strcmp(name, SEQ_COMMANDS[i]) == 0) {
+      return i;
+    }
+  }
+  return -1;
+}
+
+// Загрузка последовательности: "SEQ <n> CMD:ms CMD:ms ..."
+void process_token() {
+  if (rpi_line.error != NULL) {
+    return;
+  }
+  
+  if (rpi_line.token_index == 0) {
+    rpi_line.seq_line = strcmp(rpi_line.token, "SEQ") == 0;
+    if (rpi_line.seq_line) {
+      abort_sequence();
+      rpi_line.seq_count = 0;
+      rpi_line.seq_expected = 0;
+    } else {
+      strcpy(rpi_line.command, rpi_line.token);
+    }
+    return;
+  }
+  
+  if (!rpi_line.seq_line) {
+    rpi_line.error = "SEQ_ERR FORMAT\n";
+    return;
+  }
+  
+  if (rpi_line.token_index == 1) {
+    rpi_line.seq_expected = atol(rpi_line.token);
+    if (rpi_line.seq_expected <= 0 || rpi_line.seq_expected > SEQ_MAX_STEPS) {
+      rpi_line.error = "SEQ_ERR SIZE\n";
+    }
+    return;
+  }
+  
+  char* colon = strchr(rpi_line.token, ':');
+  int code = -1;
+  long duration = 0;
+  if (colon != NULL) {
+    *colon = '\0';
+    code = find_sequence_command(rpi_line.token);
+    duration = atol(colon + 1);
+  }
+  
+  if (code < 0 || duration <= 0 || (unsigned long)duration > SEQ_MAX_STEP_MS ||
+      rpi_line.seq_count >= SEQ_MAX_STEPS) {
+    rpi_line.error = "SEQ_ERR STEP\n";
+    return;
+  }
+  
+  sequence.commands[rpi_line.seq_count] = code;
+  sequence.durations[rpi_line.seq_count] = duration;
+  rpi_line.seq_count++;
+}
+
+void finish_line() {
+  if (rpi_line.error != NULL) {
+    queue_report(rpi_line.error);
+  } else if (rpi_line.seq_line) {
+    if (rpi_line.seq_expected == 0 || rpi_line.seq_count != rpi_line.seq_expected) {
+      queue_report("SEQ_ERR COUNT\n");
+    } else if (!state.armed) {
+      queue_report("SEQ_ERR DISARMED\n");
+    } else {
+      sequence.length = rpi_line.seq_count;
+      sequence.current = 0;
+      sequence.active = true;
+      
+      char line[16];
+      snprintf(line, sizeof(line), "SEQ_OK %u\n", sequence.length);
+      queue_report(line);
+    }
+  } else if (rpi_line.token_index > 0) {
+    if (strcmp(rpi_line.command, "SEQ_ABORT") == 0) {
+      abort_sequence();
+    } else {
+      // Любая прямая команда прерывает загруженную последовательность
+      abort_sequence();
+      execute_voice_command(rpi_line.command);
+    }
+  }
+  
+  rpi_line.token_index = 0;
+  rpi_line.seq_line = false;
+  rpi_line.error = NULL;
+}
+
+void update_sequence() {
+  if (!sequence.active) {
+    return;
+  }
+  
+  unsigned long now = millis();
+  if (sequence.current > 0 &&
+      now - sequence.step_start < sequence.durations[sequence.current - 1]) {
+    return;
+  }
+  
+  if (sequence.current >= sequence.length) {
+    sequence.active = false;
+    queue_report("SEQ_DONE\n");
+    Serial.println("Последовательность выполнена");
+    return;
+  }
+  
+  // Начало шага отсчитывается от конца предыдущего, а не от момента проверки,
+  // поэтому задержки цикла не накапливаются
+  if (sequence.current == 0) {
+    sequence.step_start = now;
+  } else {
+    sequence.step_start += sequence.durations[sequence.current - 1];
+  }
+  
+  byte step = sequence.current++;
+  execute_voice_command(SEQ_COMMANDS[sequence.commands[step]]);
+  
+  char line[20];
+  snprintf(line, sizeof(line), "SEQ_STEP %u/%u\n", step + 1, sequence.length);
+  // Промежуточный отчет отбрасывается, если не оставляет места для SEQ_DONE/SEQ_ERR
+  queue_report(line, REPORT_RESERVE);
+}
+
+void abort_sequence() {
+  if (sequence.active) {
+    sequence.active = false;
+    queue_report("SEQ_ABORTED\n");
+    Serial.println("Последовательность прервана");
+  }
+}
+
+// Строка ставится в очередь целиком или не ставится совсем
+bool queue_report(const char* text, byte reserve) {
+  byte used = (report_head + REPORT_BUFFER_SIZE - report_tail) % REPORT_BUFFER_SIZE;
+  byte free_space = REPORT_BUFFER_SIZE - 1 - used;
+  if (strlen(text) + reserve > free_space) {
+    return false;
+  }
+  
+  while (*text) {
+    report_buffer[report_head] = *text++;
+    report_head = (report_head + 1) % REPORT_BUFFER_SIZE;
+  }
+  return true;
+}
+
+void flush_report_byte() {
+  if (report_tail == report_head || rpiSerial.available() ||
+      millis() - rpi_line.last_byte_ms < RPI_IDLE_MS) {
+    return;
   }
+  rpiSerial.write(report_buffer[report_tail]);
+  report_tail = (report_tail + 1) % REPORT_BUFFER_SIZE;
 }
 
 void execute_voice_command(String cmd) {
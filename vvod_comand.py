@@ -21,6 +21,17 @@ import time
 import pickle
 import os
 import warnings
+import multiprocessing
+from multiprocessing import shared_memory
+import signal as os_signal
+import argparse
+import builtins
+import cProfile
+import pstats
+import tracemalloc
+import heapq
+import math
+import concurrent.futures
 from datetime import datetime
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
@@ -34,9 +45,13 @@ except ImportError:
 
 try:
     from scipy import signal
+    from scipy import fft as scipy_fft
+    from scipy import ndimage
 except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "scipy"])
     from scipy import signal
+    from scipy import fft as scipy_fft
+    from scipy import ndimage
 
 try:
     import serial
@@ -46,6 +61,143 @@ except ImportError:
 
 warnings.filterwarnings('ignore')
 
+class SignalConditioner:
+    """Подготовка сигнала: предыскажение, полосовой и режекторные фильтры, спектральное вычитание шума"""
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.pre_emphasis = 0.97
+        self.band = (80.0, 4000.0)
+        self.band_order = 4
+        # Частоты гармоник шума винтов, Гц; уточняются по профилю шума при ARM
+        self.notch_freqs = (150.0, 300.0, 450.0)
+        self.notch_q = 30.0
+        self.notch_count = 3
+        self.notch_range = (50.0, 1000.0)
+        self.nperseg = 512
+        self.over_subtraction = 1.5
+        self.spectral_floor = 0.05
+        
+        self.noise_profile = None
+        self._sos_cache = {}
+        self._window = signal.get_window('hann', self.nperseg).astype(np.float32)
+        self._overlap_norm = {}
+    
+    def _design_sos(self, sample_rate):
+        key = (sample_rate, self.band, self.band_order, self.notch_freqs, self.notch_q)
+        if key in self._sos_cache:
+            return self._sos_cache[key]
+        
+        nyquist = sample_rate / 2.0
+        low = self.band[0]
+        high = min(self.band[1], nyquist * 0.95)
+        sections = [signal.butter(self.band_order, [low, high], btype='bandpass',
+                                  fs=sample_rate, output='sos')]
+        
+        for freq in self.notch_freqs:
+            if 0 < freq < nyquist:
+                b, a = signal.iirnotch(freq, self.notch_q, fs=sample_rate)
+                sections.append(signal.tf2sos(b, a))
+        
+        sos = np.vstack(sections).astype(np.float32)
+        self._sos_cache[key] = sos
+        return sos
+    
+    def _find_noise_peaks(self, noise_audio):
+        """Самые сильные узкие пики спектра шума в диапазоне гармоник винтов"""
+        freqs, power = signal.welch(noise_audio, fs=self.sample_rate,
+                                    nperseg=min(len(noise_audio), 4 * self.nperseg))
+        in_range = (freqs >= self.notch_range[0]) & (freqs <= self.notch_range[1])
+        freqs, power = freqs[in_range], power[in_range]
+        
+        peaks, props = signal.find_peaks(power, prominence=np.median(power) * 10)
+        if len(peaks) == 0:
+            return None
+        strongest = peaks[np.argsort(props['prominences'])[::-1][:self.notch_count]]
+        return tuple(sorted(float(f) for f in freqs[strongest]))
+    
+    def set_noise_profile(self, noise_audio):
+        """Сохранение частот гармоник и среднего спектра шума (записывается при ARM)"""
+        noise_audio = np.asarray(noise_audio, dtype=np.float32)
+        if noise_audio.size < self.nperseg:
+            print("Слишком короткая запись шума, профиль не обновлен")
+            return False
+        
+        peaks = self._find_noise_peaks(noise_audio)
+        if peaks:
+            self.notch_freqs = peaks
+            print(f"Режекторные фильтры: {', '.join(f'{f:.0f}' for f in peaks)} Гц")
+        
+        noise_audio = self._filter(noise_audio[np.newaxis, :])
+        self.noise_profile = np.mean(np.abs(self._stft(noise_audio)[0]), axis=0)
+        print(f"Профиль шума сохранен ({len(self.noise_profile)} частотных полос)")
+        return True
+    
+    def _filter(self, batch):
+        if self.pre_emphasis:
+            emphasized = np.empty_like(batch)
+            emphasized[..., 0] = batch[..., 0]
+            np.subtract(batch[..., 1:], self.pre_emphasis * batch[..., :-1], out=emphasized[..., 1:])
+            batch = emphasized
+        sos = self._design_sos(self.sample_rate)
+        return signal.sosfilt(sos, batch, axis=-1)
+    
+    def _stft(self, batch):
+        """STFT с окном Ханна и перекрытием 50% для пачки (N, samples) → (N, кадры, полосы)"""
+        hop = self.nperseg // 2
+        n_samples = batch.shape[-1]
+        n_frames = max(1, -(-n_samples // hop) + 1)
+        padded = np.zeros(batch.shape[:-1] + ((n_frames + 1) * hop,), dtype=np.float32)
+        padded[..., hop:hop + n_samples] = batch
+        
+        frames = np.lib.stride_tricks.sliding_window_view(padded, self.nperseg, axis=-1)[..., ::hop, :]
+        return scipy_fft.rfft(frames * self._window, axis=-1, workers=-1)
+    
+    def _istft(self, spectrum, n_samples):
+        hop = self.nperseg // 2
+        n_frames = spectrum.shape[-2]
+        frames = scipy_fft.irfft(spectrum, n=self.nperseg, axis=-1, workers=-1) * self._window
+        
+        # При перекрытии 50% каждый кадр складывается из двух половин соседних окон
+        restored = np.zeros(spectrum.shape[:-2] + (n_frames + 1, hop), dtype=np.float32)
+        restored[..., :-1, :] += frames[..., :hop]
+        restored[..., 1:, :] += frames[..., hop:]
+        restored = restored.reshape(spectrum.shape[:-2] + (-1,))
+        
+        if n_frames not in self._overlap_norm:
+            squared = self._window ** 2
+            norm = np.zeros((n_frames + 1, hop), dtype=np.float32)
+            norm[:-1] += squared[:hop]
+            norm[1:] += squared[hop:]
+            self._overlap_norm[n_frames] = np.maximum(norm.reshape(-1), 1e-6)
+        restored /= self._overlap_norm[n_frames]
+        
+        return restored[..., hop:hop + n_samples]
+    
+    def spectral_subtract(self, batch):
+        if self.noise_profile is None:
+            return batch
+        
+        # Короткие записи дополняются нулями внутри _stft, число полос всегда nperseg // 2 + 1
+        spectrum = self._stft(batch)
+        magnitude = np.maximum(np.abs(spectrum), 1e-12)
+        gain = np.maximum(1.0 - self.over_subtraction * self.noise_profile / magnitude,
+                          self.spectral_floor)
+        return self._istft(spectrum * gain, batch.shape[-1])
+    
+    def process_batch(self, batch):
+        """Обработка пачки записей формы (N, samples) или одной записи"""
+        batch = np.asarray(batch, dtype=np.float32)
+        single = batch.ndim == 1
+        batch = np.atleast_2d(batch)
+        
+        if batch.shape[-1] == 0:
+            return batch[0] if single else batch
+        
+        batch = self._filter(batch)
+        batch = self.spectral_subtract(batch)
+        
+        return batch[0] if single else batch
+
 class VoiceTrainer:
     def __init__(self, data_dir='voice_commands'):
         self.samples_needed = 4
@@ -54,11 +206,18 @@ class VoiceTrainer:
         self.sample_rate = 16000
         self.data_dir = data_dir
         
+        # Пороги уровней уверенности распознавания
+        self.high_confidence = 0.7
+        self.medium_confidence = 0.5
+        
         if not os.path.exists(data_dir):
             os.makedirs(data_dir)
         
+        self.conditioner = SignalConditioner(self.sample_rate)
+        
         self.commands_db = {}
         self.load_existing_commands()
+        self.load_thresholds()
     
     def load_existing_commands(self):
         db_file = os.path.join(self.data_dir, 'commands_db.pkl')
@@ -73,6 +232,20 @@ class VoiceTrainer:
             pickle.dump(self.commands_db, f)
         print(f"База команд сохранена ({len(self.commands_db)} команд)")
     
+    def load_thresholds(self):
+        thresholds_file = os.path.join(self.data_dir, 'thresholds.pkl')
+        if os.path.exists(thresholds_file):
+            with open(thresholds_file, 'rb') as f:
+                thresholds = pickle.load(f)
+            self.high_confidence = thresholds['high']
+            self.medium_confidence = thresholds['medium']
+            print(f"Загружены пороги уверенности: {self.high_confidence:.2f} / {self.medium_confidence:.2f}")
+    
+    def save_thresholds(self):
+        thresholds_file = os.path.join(self.data_dir, 'thresholds.pkl')
+        with open(thresholds_file, 'wb') as f:
+            pickle.dump({'high': self.high_confidence, 'medium': self.medium_confidence}, f)
+    
     def _generate_test_audio(self, duration_seconds):
         t = np.linspace(0, duration_seconds, int(duration_seconds * self.sample_rate))
         
@@ -111,6 +284,17 @@ class VoiceTrainer:
         
         return audio
     
+    def capture_noise_profile(self, duration_seconds=1):
+        """Запись фонового шума винтов для спектрального вычитания"""
+        print("\nИмитация записи шума винтов...")
+        n_samples = int(duration_seconds * self.sample_rate)
+        t = np.arange(n_samples) / self.sample_rate
+        noise = 0.05 * np.random.randn(n_samples)
+        rotor_freq = 140 + np.random.rand() * 40
+        for harmonic in (1, 2, 3):
+            noise += 0.1 * np.sin(2 * np.pi * harmonic * rotor_freq * t)
+        return self.conditioner.set_noise_profile(noise)
+    
     def extract_mfcc_features(self, audio_data, n_mfcc=13):
         try:
             if len(audio_data) == 0:
@@ -145,6 +329,9 @@ class VoiceTrainer:
             if sample_num < self.samples_needed - 1:
                 time.sleep(self.pause_duration)
         
+        print("\nПодготовка сигнала...")
+        collected_samples = self.conditioner.process_batch(np.stack(collected_samples))
+        
         print("\nИзвлечение признаков...")
         features_list = []
         for i, audio in enumerate(collected_samples):
@@ -230,9 +417,10 @@ class VoiceTrainer:
             bar_length = int(similarity * 20)
             bar = "#" * bar_length + "-" * (20 - bar_length)
             
-            if similarity > 0.7:
+            # Как при оценке по корпусу: порог принимает значения >= себя
+            if similarity >= self.high_confidence:
                 confidence = "ВЫСОКАЯ"
-            elif similarity > 0.5:
+            elif similarity >= self.medium_confidence:
                 confidence = "СРЕДНЯЯ"
             else:
                 confidence = "НИЗКАЯ"
@@ -266,6 +454,14 @@ class ArduinoCommander:
             'UP', 'DOWN', 'ROTATE_LEFT', 'ROTATE_RIGHT',
             'ARM', 'DISARM'
         ]
+        
+        # Должно совпадать с SEQ_MAX_STEPS, SEQ_MAX_STEP_MS и SEQ_COMMANDS в прошивке
+        self.max_sequence_steps = 32
+        self.max_step_duration_ms = 262140
+        
+        # Вызывается после успешной отправки ARM (запись профиля шума винтов)
+        self.on_arm = None
+        self.sequence_commands = [cmd for cmd in self.supported_commands if cmd not in ('ARM', 'DISARM')]
     
     def connect(self):
         print(f"Подключение к Arduino...")
@@ -289,6 +485,8 @@ class ArduinoCommander:
         time.sleep(0.5)
         
         print(f"Команда '{command}' отправлена успешно")
+        if command == 'ARM' and self.on_arm is not None:
+            self.on_arm()
         return True
     
     def send_sequence(self, commands):
@@ -300,33 +498,764 @@ class ArduinoCommander:
             time.sleep(duration / 1000.0)
         return True
     
+    def upload_sequence(self, commands):
+        """Загрузка всей последовательности в контроллер одной передачей"""
+        if not self.connected:
+            print("Сначала подключитесь к Arduino")
+            return False
+        
+        if not commands or len(commands) > self.max_sequence_steps:
+            print(f"Последовательность должна содержать от 1 до {self.max_sequence_steps} команд")
+            return False
+        
+        for cmd, duration in commands:
+            if cmd not in self.sequence_commands:
+                print(f"Команда '{cmd}' не поддерживается в загружаемой последовательности")
+                print(f"Поддерживаемые команды: {', '.join(self.sequence_commands)}")
+                return False
+            if not 0 < duration <= self.max_step_duration_ms:
+                print(f"Длительность шага {cmd} должна быть от 1 до {self.max_step_duration_ms} мс")
+                return False
+        
+        payload = f"SEQ {len(commands)} " + " ".join(f"{cmd}:{duration}" for cmd, duration in commands)
+        print(f"\nЗагрузка последовательности в контроллер ({len(payload) + 1} байт):")
+        print(f"  {payload}")
+        time.sleep(0.5)
+        
+        # Контроллер отвечает SEQ_ERR DISARMED, если дрон не включен
+        print(f"Ответ контроллера: SEQ_OK {len(commands)}")
+        return True
+    
+    def wait_sequence(self, commands):
+        """Прием отчетов контроллера о ходе выполнения (симуляция)"""
+        # При коротких шагах контроллер пропускает часть SEQ_STEP, чтобы не
+        # переполнить очередь отчетов; конец последовательности - только SEQ_DONE
+        total = len(commands)
+        for i, (cmd, duration) in enumerate(commands, 1):
+            print(f"  SEQ_STEP {i}/{total}: {cmd} ({duration}ms)")
+            time.sleep(duration / 1000.0)
+        
+        print("  SEQ_DONE")
+        return True
+    
     def close(self):
         if self.connected:
             self.connected = False
             print("Соединение с Arduino закрыто")
 
+class CommandLexicon:
+    """Двуязычный (RU/EN) словарь фраз с точным и нечетким поиском по префиксному дереву"""
+    DEFAULT_PHRASES = {
+        'TAKEOFF': ['взлет', 'взлетай', 'взлететь', 'взлетаем', 'takeoff', 'take off', 'lift off', 'launch'],
+        'LAND': ['посадка', 'садись', 'приземлись', 'приземлиться', 'land', 'landing', 'touch down'],
+        'HOVER': ['зависни', 'зависание', 'зависнуть', 'держи позицию', 'hover', 'hold', 'hold position'],
+        'STOP': ['стоп', 'стой', 'остановись', 'хватит', 'stop', 'halt', 'abort'],
+        'FORWARD': ['вперед', 'прямо', 'лети вперед', 'forward', 'ahead', 'go forward'],
+        'BACK': ['назад', 'лети назад', 'back', 'backward', 'backwards', 'go back'],
+        'LEFT': ['влево', 'налево', 'лети влево', 'left', 'go left'],
+        'RIGHT': ['вправо', 'направо', 'лети вправо', 'right', 'go right'],
+        'UP': ['вверх', 'выше', 'наверх', 'поднимись', 'up', 'higher', 'climb', 'ascend'],
+        'DOWN': ['вниз', 'ниже', 'опустись', 'снижайся', 'down', 'lower', 'descend'],
+        'ROTATE_LEFT': ['поворот влево', 'повернись влево', 'разворот влево', 'rotate left', 'turn left', 'yaw left'],
+        'ROTATE_RIGHT': ['поворот вправо', 'повернись вправо', 'разворот вправо', 'rotate right', 'turn right', 'yaw right'],
+        'ARM': ['включить', 'включи', 'запуск моторов', 'arm', 'start motors'],
+        'DISARM': ['выключить', 'выключи', 'остановка моторов', 'disarm', 'stop motors', 'kill motors'],
+    }
+    
+    def __init__(self, data_dir='voice_commands', supported_commands=None):
+        self.data_dir = data_dir
+        self.supported_commands = supported_commands
+        
+        self.phrases = {}
+        self.custom_phrases = {}
+        self._trie = {}
+        
+        for action, phrases in self.DEFAULT_PHRASES.items():
+            for phrase in phrases:
+                self._add(phrase, action)
+        self._default_phrases = dict(self.phrases)
+        
+        self.load_lexicon()
+    
+    @staticmethod
+    def normalize(text):
+        text = text.lower().replace('ё', 'е')
+        text = ''.join(ch if ch.isalnum() else ' ' for ch in text)
+        return ' '.join(text.split())
+    
+    def _add(self, phrase, action):
+        key = self.normalize(phrase)
+        if not key:
+            return None
+        
+        self.phrases[key] = action
+        node = self._trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[None] = key
+        return key
+    
+    def load_lexicon(self):
+        lexicon_file = os.path.join(self.data_dir, 'lexicon.pkl')
+        if os.path.exists(lexicon_file):
+            with open(lexicon_file, 'rb') as f:
+                self.custom_phrases = pickle.load(f)
+            for phrase, action in self.custom_phrases.items():
+                self._add(phrase, action)
+            print(f"Загружено {len(self.custom_phrases)} пользовательских фраз")
+    
+    def save_lexicon(self):
+        lexicon_file = os.path.join(self.data_dir, 'lexicon.pkl')
+        with open(lexicon_file, 'wb') as f:
+            pickle.dump(self.custom_phrases, f)
+    
+    def add_phrase(self, phrase, action):
+        if self.supported_commands is not None and action not in self.supported_commands:
+            print(f"Неподдерживаемое действие дрона: {action}")
+            return False
+        
+        key = self._add(phrase, action)
+        if key is None:
+            return False
+        
+        self.custom_phrases[key] = action
+        self.save_lexicon()
+        return True
+    
+    def phrases_by_action(self):
+        """Стандартные и пользовательские фразы, сгруппированные по действиям"""
+        grouped = {action: [p for p in phrases if self.phrases.get(self.normalize(p)) == action]
+                   for action, phrases in self.DEFAULT_PHRASES.items()}
+        for phrase, action in self.custom_phrases.items():
+            if phrase not in grouped.setdefault(action, []):
+                grouped[action].append(phrase)
+        return grouped
+    
+    def remove_phrase(self, phrase):
+        key = self.normalize(phrase)
+        if key not in self.custom_phrases:
+            return False
+        
+        del self.custom_phrases[key]
+        self.save_lexicon()
+        
+        if key in self._default_phrases:
+            self.phrases[key] = self._default_phrases[key]
+            return True
+        
+        del self.phrases[key]
+        path = [self._trie]
+        for ch in key:
+            path.append(path[-1][ch])
+        del path[-1][None]
+        
+        # Удаление опустевших узлов дерева
+        for depth in range(len(key), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][key[depth - 1]]
+        return True
+    
+    def _fuzzy_search(self, node, char, prev_row, word, max_distance, results):
+        row = [prev_row[0] + 1]
+        for i in range(1, len(word) + 1):
+            row.append(min(row[i - 1] + 1,
+                           prev_row[i] + 1,
+                           prev_row[i - 1] + (word[i - 1] != char)))
+        
+        if None in node and row[-1] <= max_distance:
+            results.append((row[-1], node[None]))
+        
+        if min(row) <= max_distance:
+            for next_char, child in node.items():
+                if next_char is not None:
+                    self._fuzzy_search(child, next_char, row, word, max_distance, results)
+    
+    def lookup(self, text, max_distance=None):
+        """Поиск действия по фразе: (действие, фраза, расстояние) или None"""
+        key = self.normalize(text)
+        if not key:
+            return None
+        
+        if key in self.phrases:
+            return self.phrases[key], key, 0
+        
+        if max_distance is None:
+            max_distance = 1 if len(key) <= 5 else 2
+        
+        results = []
+        first_row = list(range(len(key) + 1))
+        for char, child in self._trie.items():
+            if char is not None:
+                self._fuzzy_search(child, char, first_row, key, max_distance, results)
+        
+        if not results:
+            return None
+        
+        distance, phrase = min(results)
+        # Неоднозначно, если на том же расстоянии есть фраза другого действия
+        actions = {self.phrases[p] for d, p in results if d == distance}
+        if len(actions) > 1:
+            return None
+        return self.phrases[phrase], phrase, distance
+
+class MissionPlanner:
+    """Планировщик миссии: счисление пути, обход препятствий (JPS) и возврат на зарядку"""
+    MAV_COMMANDS = {
+        'TAKEOFF': 22,
+        'LAND': 21,
+        'HOVER': 16,
+        'FORWARD': 16,
+        'BACK': 16,
+        'LEFT': 16,
+        'RIGHT': 16,
+        'UP': 16,
+        'DOWN': 16,
+        'ROTATE_LEFT': 115,
+        'ROTATE_RIGHT': 115
+    }
+    
+    EARTH_METERS_PER_DEGREE = 111320.0
+    
+    def __init__(self, home=(0.0, 0.0), charger=None):
+        self.home = home
+        self.charger = charger if charger is not None else home
+        
+        self.horizontal_speed = 2.0   # м/с
+        self.vertical_speed = 1.0     # м/с
+        self.yaw_rate = 90.0          # град/с
+        self.takeoff_altitude = 10.0  # м
+        
+        # Энергетическая модель, Вт*ч
+        self.battery_wh = 50.0
+        self.reserve_fraction = 0.2
+        self.wh_per_meter = 0.02
+        self.wh_per_climb_meter = 0.1
+        self.hover_watts = 150.0
+        
+        # Бюджет времени на поиск путей за один вызов plan(), мс
+        self.planning_budget_ms = 300.0
+        
+        # Радиус дрона с винтами: препятствия на карте расширяются на него
+        self.drone_radius = 0.5       # м
+        
+        self.obstacles = None
+        self.grid = None
+        self.resolution = 1.0
+        self.origin = (0, 0)
+        self._segment_cache = {}
+        self._jump_tables = None
+        self._deadline = None
+        self._budget_exceeded = False
+    
+    @staticmethod
+    def parse_movement(movement):
+        parts = movement.split(':')
+        cmd = parts[0].strip().upper() if parts else 'HOVER'
+        try:
+            duration = int(parts[1].strip())
+        except (IndexError, ValueError):
+            duration = 1000
+        return cmd, duration
+    
+    def set_occupancy_grid(self, grid, resolution=1.0, origin=None):
+        """Сетка занятости: grid[row, col] = True для препятствия, строки - на север"""
+        self.obstacles = np.asarray(grid, dtype=bool)
+        self.resolution = resolution
+        if origin is None:
+            origin = (self.obstacles.shape[0] // 2, self.obstacles.shape[1] // 2)
+        self.origin = tuple(int(v) for v in origin)
+        
+        # Планирование идет по карте, расширенной на радиус дрона
+        radius = int(math.ceil(self.drone_radius / resolution))
+        if radius > 0 and self.obstacles.any():
+            offsets = np.arange(-radius, radius + 1)
+            disk = offsets[:, np.newaxis] ** 2 + offsets[np.newaxis, :] ** 2 <= radius ** 2
+            inflated = ndimage.binary_dilation(self.obstacles, structure=disk)
+        else:
+            inflated = self.obstacles
+        self.grid = np.ascontiguousarray(inflated)
+        self._segment_cache = {}
+        self._jump_tables = None
+    
+    def load_site(self, filename):
+        """Площадка из .npz: home и charger (lat, lon), карта grid, resolution (м) и origin (клетка home)"""
+        if not os.path.exists(filename):
+            print(f"Файл площадки {filename} не найден: точки миссии считаются от 0.0, 0.0")
+            return False
+        
+        with np.load(filename) as site:
+            self.home = tuple(float(v) for v in site['home'])
+            self.charger = tuple(float(v) for v in site['charger']) if 'charger' in site else self.home
+            if 'grid' in site:
+                origin = tuple(site['origin']) if 'origin' in site else None
+                resolution = float(site['resolution']) if 'resolution' in site else 1.0
+                self.set_occupancy_grid(site['grid'], resolution, origin)
+                print(f"Загружена карта препятствий {self.grid.shape[0]}x{self.grid.shape[1]} "
+                      f"({self.resolution} м/клетка)")
+        
+        print(f"Площадка: старт {self.home[0]:.6f}, {self.home[1]:.6f}; "
+              f"зарядка {self.charger[0]:.6f}, {self.charger[1]:.6f}")
+        return True
+    
+    def _to_cell(self, x, y):
+        return (self.origin[0] + int(round(y / self.resolution)),
+                self.origin[1] + int(round(x / self.resolution)))
+    
+    def _to_xy(self, cell):
+        return ((cell[1] - self.origin[1]) * self.resolution,
+                (cell[0] - self.origin[0]) * self.resolution)
+    
+    def _inside(self, cell):
+        return 0 <= cell[0] < self.grid.shape[0] and 0 <= cell[1] < self.grid.shape[1]
+    
+    @staticmethod
+    def _boundary_crossings(start, end):
+        # Параметры t пересечения отрезком границ клеток k + 0.5 по одной оси
+        if start == end:
+            return np.empty(0)
+        low, high = sorted((start, end))
+        bounds = np.arange(math.ceil(low - 0.5), math.floor(high - 0.5) + 1) + 0.5
+        return (bounds - start) / (end - start)
+    
+    def _line_cells(self, a, b):
+        """Все клетки, которых касается отрезок между центрами клеток a и b (supercover), по порядку"""
+        row_t = self._boundary_crossings(a[0], b[0])
+        col_t = self._boundary_crossings(a[1], b[1])
+        t = np.unique(np.concatenate(([0.0, 1.0], row_t, col_t)))
+        
+        # Внутри интервала между соседними пересечениями отрезок идет по одной клетке
+        mid = np.concatenate(([0.0], (t[:-1] + t[1:]) / 2, [1.0]))
+        rows = np.rint(a[0] + (b[0] - a[0]) * mid).astype(np.intp)
+        cols = np.rint(a[1] + (b[1] - a[1]) * mid).astype(np.intp)
+        
+        # Проход точно через угол касается и двух соседних по диагонали клеток
+        corners = row_t[np.isin(np.round(row_t, 9), np.round(col_t, 9))]
+        if len(corners):
+            idx = np.searchsorted(mid, corners)
+            dr = np.sign(b[0] - a[0])
+            before_r, before_c = rows[idx - 1], cols[idx - 1]
+            rows = np.insert(rows, np.repeat(idx, 2), np.stack([before_r + dr, before_r], axis=1).ravel())
+            cols = np.insert(cols, np.repeat(idx, 2), np.stack([before_c, before_c + np.sign(b[1] - a[1])], axis=1).ravel())
+        
+        inside = (rows >= 0) & (rows < self.grid.shape[0]) & (cols >= 0) & (cols < self.grid.shape[1])
+        return rows, cols, inside
+    
+    def _line_is_free(self, a, b):
+        rows, cols, inside = self._line_cells(a, b)
+        return not self.grid[rows[inside], cols[inside]].any()
+    
+    def _free(self, row, col):
+        # Сетка с рамкой из препятствий: соседи клеток сетки не выходят за границы
+        return self._walk_flat[(row + 1) * self._walk_cols + col + 1] == 1
+    
+    def _build_jump_tables(self):
+        # Для каждой клетки - индекс ближайшей остановки (стена или вынужденный сосед)
+        # в каждом из четырех прямых направлений; прямой прыжок JPS становится O(1)
+        rows, cols = self.grid.shape
+        walk = np.zeros((rows + 2, cols + 2), dtype=bool)
+        walk[1:-1, 1:-1] = ~self.grid
+        center = walk[1:-1, 1:-1]
+        
+        def stops(side_a, back_a, side_b, back_b):
+            return ~center | (side_a & ~back_a) | (side_b & ~back_b)
+        
+        east = stops(walk[:-2, 1:-1], walk[:-2, :-2], walk[2:, 1:-1], walk[2:, :-2])
+        west = stops(walk[:-2, 1:-1], walk[:-2, 2:], walk[2:, 1:-1], walk[2:, 2:])
+        south = stops(walk[1:-1, :-2], walk[:-2, :-2], walk[1:-1, 2:], walk[:-2, 2:])
+        north = stops(walk[1:-1, :-2], walk[2:, :-2], walk[1:-1, 2:], walk[2:, 2:])
+        
+        col_idx = np.arange(cols, dtype=np.int32)[np.newaxis, :]
+        row_idx = np.arange(rows, dtype=np.int32)[:, np.newaxis]
+        
+        tables = {
+            (0, 1): np.minimum.accumulate(np.where(east, col_idx, cols)[:, ::-1], axis=1)[:, ::-1],
+            (0, -1): np.maximum.accumulate(np.where(west, col_idx, -1), axis=1),
+            (1, 0): np.minimum.accumulate(np.where(south, row_idx, rows)[::-1, :], axis=0)[::-1, :],
+            (-1, 0): np.maximum.accumulate(np.where(north, row_idx, -1), axis=0),
+        }
+        
+        # memoryview отдает элементы как int Python без накладных расходов numpy
+        self._jump_tables = {
+            direction: memoryview(np.ascontiguousarray(table, dtype=np.int32).ravel())
+            for direction, table in tables.items()
+        }
+        self._walk_flat = walk.astype(np.uint8).tobytes()
+        self._walk_cols = cols + 2
+    
+    def _straight_jump(self, row, col, dr, dc, goal):
+        if not self._free(row, col):
+            return None
+        
+        stop = self._jump_tables[(dr, dc)][row * self.grid.shape[1] + col]
+        if dr == 0:
+            if goal[0] == row and min(col, stop) <= goal[1] <= max(col, stop):
+                return goal
+            cell = (row, stop)
+        else:
+            if goal[1] == col and min(row, stop) <= goal[0] <= max(row, stop):
+                return goal
+            cell = (stop, col)
+        
+        return cell if self._free(*cell) else None
+    
+    def _jump(self, row, col, dr, dc, goal):
+        if dr == 0 or dc == 0:
+            return self._straight_jump(row, col, dr, dc, goal)
+        
+        while self._free(row, col):
+            if (row, col) == goal:
+                return goal
+            if (self._straight_jump(row, col + dc, 0, dc, goal) is not None
+                    or self._straight_jump(row + dr, col, dr, 0, goal) is not None):
+                return (row, col)
+            if not (self._free(row, col + dc) and self._free(row + dr, col)):
+                return None
+            row += dr
+            col += dc
+        return None
+    
+    def _pruned_directions(self, node, parent):
+        row, col = node
+        if parent is None:
+            directions = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+            return [(dr, dc) for dr, dc in directions
+                    if self._free(row + dr, col + dc)
+                    and (not (dr and dc) or (self._free(row + dr, col) and self._free(row, col + dc)))]
+        
+        dr = (row > parent[0]) - (row < parent[0])
+        dc = (col > parent[1]) - (col < parent[1])
+        directions = []
+        
+        if dr and dc:
+            free_r = self._free(row + dr, col)
+            free_c = self._free(row, col + dc)
+            if free_r:
+                directions.append((dr, 0))
+            if free_c:
+                directions.append((0, dc))
+            if free_r and free_c:
+                directions.append((dr, dc))
+        elif dc:
+            free_next = self._free(row, col + dc)
+            for side in (-1, 1):
+                if self._free(row + side, col):
+                    directions.append((side, 0))
+                    if free_next:
+                        directions.append((side, dc))
+            if free_next:
+                directions.append((0, dc))
+        else:
+            free_next = self._free(row + dr, col)
+            for side in (-1, 1):
+                if self._free(row, col + side):
+                    directions.append((0, side))
+                    if free_next:
+                        directions.append((dr, side))
+            if free_next:
+                directions.append((dr, 0))
+        
+        return directions
+    
+    @staticmethod
+    def _octile(a, b):
+        dr, dc = abs(a[0] - b[0]), abs(a[1] - b[1])
+        return max(dr, dc) + 0.41421356 * min(dr, dc)
+    
+    def _find_path(self, start, goal):
+        """Jump Point Search по 8-связной сетке без срезания углов"""
+        if self._jump_tables is None:
+            self._build_jump_tables()
+        
+        cost = {start: 0.0}
+        came_from = {start: None}
+        open_heap = [(self._octile(start, goal), 0.0, start)]
+        
+        expanded = 0
+        while open_heap:
+            expanded += 1
+            if self._deadline is not None and expanded % 256 == 0 and time.perf_counter() > self._deadline:
+                self._budget_exceeded = True
+                return None
+            
+            _, current_cost, current = heapq.heappop(open_heap)
+            if current == goal:
+                path = [current]
+                while came_from[current] is not None:
+                    current = came_from[current]
+                    path.append(current)
+                return path[::-1]
+            
+            if current_cost > cost[current]:
+                continue
+            
+            for dr, dc in self._pruned_directions(current, came_from[current]):
+                point = self._jump(current[0] + dr, current[1] + dc, dr, dc, goal)
+                if point is None:
+                    continue
+                
+                new_cost = current_cost + self._octile(current, point)
+                if new_cost < cost.get(point, float('inf')):
+                    cost[point] = new_cost
+                    came_from[point] = current
+                    heapq.heappush(open_heap, (new_cost + self._octile(point, goal), new_cost, point))
+        
+        return None
+    
+    def _smooth_path(self, path):
+        smoothed = [path[0]]
+        anchor = 0
+        while anchor < len(path) - 1:
+            nxt = anchor + 1
+            while nxt + 1 < len(path) and self._line_is_free(path[anchor], path[nxt + 1]):
+                nxt += 1
+            smoothed.append(path[nxt])
+            anchor = nxt
+        return smoothed
+    
+    def _grid_path(self, start, goal):
+        """Клетки маршрута после start (включая goal) или None"""
+        if self.grid[start] or self.grid[goal]:
+            return None
+        if start == goal or self._line_is_free(start, goal):
+            return [goal]
+        path = self._find_path(start, goal)
+        return self._smooth_path(path)[1:] if path else None
+    
+    def plan_segment(self, start_xy, goal_xy):
+        """Промежуточные точки (x, y) от start до goal с обходом препятствий или None"""
+        if self.grid is None:
+            return [goal_xy]
+        
+        start = self._to_cell(*start_xy)
+        goal = self._to_cell(*goal_xy)
+        key = (start, goal)
+        
+        if key not in self._segment_cache:
+            # Отрезок пересекает прямоугольник сетки по одному интервалу; вне сетки
+            # препятствий нет, поэтому планируется только часть внутри сетки
+            rows, cols, inside = self._line_cells(start, goal)
+            if not inside.any() or not self.grid[rows[inside], cols[inside]].any():
+                cells = []
+            elif self._inside(start) and self._inside(goal):
+                path = self._grid_path(start, goal)
+                cells = path[:-1] if path else None
+            elif self._inside(start):
+                exit_idx = np.flatnonzero(inside)[-1]
+                cells = self._grid_path(start, (int(rows[exit_idx]), int(cols[exit_idx])))
+            elif self._inside(goal):
+                entry_idx = np.flatnonzero(inside)[0]
+                entry = (int(rows[entry_idx]), int(cols[entry_idx]))
+                path = self._grid_path(entry, goal)
+                cells = [entry] + path[:-1] if path else None
+            else:
+                cells = None
+            
+            if cells is None and self._budget_exceeded:
+                return None
+            self._segment_cache[key] = cells
+        
+        cells = self._segment_cache[key]
+        if cells is None:
+            return None
+        return [self._to_xy(cell) for cell in cells] + [goal_xy]
+    
+    def to_geodetic(self, x, y):
+        lat = self.home[0] + y / self.EARTH_METERS_PER_DEGREE
+        lon = self.home[1] + x / (self.EARTH_METERS_PER_DEGREE * math.cos(math.radians(self.home[0])))
+        return lat, lon
+    
+    def _charger_xy(self):
+        y = (self.charger[0] - self.home[0]) * self.EARTH_METERS_PER_DEGREE
+        x = (self.charger[1] - self.home[1]) * self.EARTH_METERS_PER_DEGREE * math.cos(math.radians(self.home[0]))
+        return x, y
+    
+    def _waypoint(self, x, y, alt, command, params=None):
+        lat, lon = self.to_geodetic(x, y)
+        params = list(params or [])
+        return {
+            'lat': lat,
+            'lon': lon,
+            'alt': alt,
+            'command': command,
+            'params': params + [0] * (7 - len(params)),
+        }
+    
+    @staticmethod
+    def _route_length(start, route):
+        length = 0.0
+        prev = start
+        for point in route:
+            length += math.hypot(point[0] - prev[0], point[1] - prev[1])
+            prev = point
+        return length
+    
+    def _move_energy(self, distance, climb):
+        return distance * self.wh_per_meter + max(climb, 0) * self.wh_per_climb_meter
+    
+    def plan(self, movement_sequence):
+        """Миссия по последовательности движений: (точки, сводка)"""
+        start_time = time.perf_counter()
+        self._deadline = start_time + self.planning_budget_ms / 1000.0
+        self._budget_exceeded = False
+        usable_wh = self.battery_wh * (1 - self.reserve_fraction)
+        charger_xy = self._charger_xy()
+        
+        x, y, alt, heading = 0.0, 0.0, 0.0, 0.0
+        energy = 0.0
+        distance = 0.0
+        truncated = False
+        waypoints = []
+        
+        for movement in movement_sequence:
+            cmd, duration = self.parse_movement(movement)
+            seconds = duration / 1000.0
+            
+            new_x, new_y, new_alt, hold = x, y, alt, 0.0
+            params = []
+            
+            if cmd in ('FORWARD', 'BACK', 'LEFT', 'RIGHT'):
+                offset = {'FORWARD': 0, 'RIGHT': 90, 'BACK': 180, 'LEFT': 270}[cmd]
+                direction = math.radians(heading + offset)
+                step = self.horizontal_speed * seconds
+                new_x += step * math.sin(direction)
+                new_y += step * math.cos(direction)
+            elif cmd == 'UP':
+                new_alt += self.vertical_speed * seconds
+            elif cmd == 'DOWN':
+                new_alt = max(0.0, alt - self.vertical_speed * seconds)
+            elif cmd == 'TAKEOFF':
+                new_alt = max(alt, self.takeoff_altitude)
+                params = [0, 0, 0, 0, 0, 0, new_alt]
+            elif cmd == 'LAND':
+                new_alt = 0.0
+            elif cmd in ('ROTATE_LEFT', 'ROTATE_RIGHT'):
+                sign = -1 if cmd == 'ROTATE_LEFT' else 1
+                angle = self.yaw_rate * seconds
+                heading = (heading + sign * angle) % 360
+                hold = seconds
+                params = [angle, self.yaw_rate, sign, 1]
+            elif cmd in ('HOVER', 'STOP'):
+                hold = seconds
+                params = [seconds]
+            else:
+                continue
+            
+            # Грубая оценка до поиска пути: прямой отрезок - нижняя граница длины
+            direct = math.hypot(new_x - x, new_y - y)
+            if energy + self._move_energy(direct, new_alt - alt) > usable_wh:
+                print(f"Недостаточно заряда для '{movement}', миссия сокращена")
+                truncated = True
+                break
+            
+            route = self.plan_segment((x, y), (new_x, new_y))
+            return_route = self.plan_segment((new_x, new_y), charger_xy) if route is not None else None
+            if self._budget_exceeded:
+                print(f"Превышен бюджет планирования ({self.planning_budget_ms:.0f} мс), "
+                      f"миссия сокращена на '{movement}'")
+                truncated = True
+                break
+            # Пропуск движения сдвинул бы все следующие точки относительно замысла оператора
+            if route is None:
+                print(f"Не удалось обойти препятствие для '{movement}', миссия сокращена")
+                truncated = True
+                break
+            if return_route is None:
+                print(f"После '{movement}' нет пути к зарядке, миссия сокращена")
+                truncated = True
+                break
+            
+            leg = self._route_length((x, y), route)
+            
+            leg_energy = (self._move_energy(leg, new_alt - alt)
+                          + hold * self.hover_watts / 3600.0)
+            return_energy = self._move_energy(self._route_length((new_x, new_y), return_route),
+                                              self.takeoff_altitude - new_alt)
+            
+            if energy + leg_energy + return_energy > usable_wh:
+                print(f"Недостаточно заряда для '{movement}', миссия сокращена")
+                truncated = True
+                break
+            
+            for point in route[:-1]:
+                waypoints.append(self._waypoint(point[0], point[1], alt, 16))
+            waypoints.append(self._waypoint(new_x, new_y, new_alt, self.MAV_COMMANDS.get(cmd, 16), params))
+            
+            x, y, alt = new_x, new_y, new_alt
+            energy += leg_energy
+            distance += leg
+        
+        # Возврат на зарядку; путь из текущей точки уже проверен и закэширован,
+        # кроме случая, когда ни одно движение не принято
+        self._deadline = None
+        return_route = self.plan_segment((x, y), charger_xy)
+        if return_route is None:
+            print("Нет пути к зарядке без пересечения препятствий, миссия не создана")
+            return None, None
+        
+        at_charger = math.hypot(charger_xy[0] - x, charger_xy[1] - y) < self.resolution
+        return_alt = alt if at_charger else max(alt, self.takeoff_altitude)
+        
+        leg = self._route_length((x, y), return_route)
+        for point in return_route[:-1]:
+            waypoints.append(self._waypoint(point[0], point[1], return_alt, 16))
+        
+        distance += leg
+        energy += self._move_energy(leg, return_alt - alt)
+        
+        if self.charger == self.home:
+            waypoints.append(self._waypoint(0.0, 0.0, 0.0, 20))
+        else:
+            waypoints.append(self._waypoint(charger_xy[0], charger_xy[1], 0.0, 21))
+        
+        summary = {
+            'distance_m': distance,
+            'energy_wh': energy,
+            'truncated': truncated,
+            'planning_ms': (time.perf_counter() - start_time) * 1000.0,
+        }
+        return waypoints, summary
+
 class VoiceDroneController:
     def __init__(self):
         self.trainer = VoiceTrainer()
         self.commander = ArduinoCommander()
+        self.commander.on_arm = self.trainer.capture_noise_profile
         self.command_mapping = {}
         
-        self.standard_mappings = {
-            'взлет': 'TAKEOFF',
-            'посадка': 'LAND',
-            'зависни': 'HOVER',
-            'стоп': 'STOP',
-            'вперед': 'FORWARD',
-            'назад': 'BACK',
-            'влево': 'LEFT',
-            'вправо': 'RIGHT',
-            'вверх': 'UP',
-            'вниз': 'DOWN',
-            'поворот влево': 'ROTATE_LEFT',
-            'поворот вправо': 'ROTATE_RIGHT',
-            'включить': 'ARM',
-            'выключить': 'DISARM'
-        }
+        self.lexicon = CommandLexicon(self.trainer.data_dir, self.commander.supported_commands)
+        
+        self.planner = MissionPlanner()
+        self.planner.load_site(os.path.join(self.trainer.data_dir, 'site.npz'))
+        
+        self.load_command_mapping()
+    
+    def load_command_mapping(self):
+        mapping_file = os.path.join(self.trainer.data_dir, 'command_mapping.pkl')
+        if os.path.exists(mapping_file):
+            with open(mapping_file, 'rb') as f:
+                self.command_mapping = pickle.load(f)
+            print(f"Загружено {len(self.command_mapping)} привязок")
+    
+    def save_command_mapping(self):
+        mapping_file = os.path.join(self.trainer.data_dir, 'command_mapping.pkl')
+        with open(mapping_file, 'wb') as f:
+            pickle.dump(self.command_mapping, f)
+    
+    def remove_mapping(self, voice_command):
+        removed = self.lexicon.remove_phrase(voice_command)
+        if voice_command in self.command_mapping:
+            del self.command_mapping[voice_command]
+            self.save_command_mapping()
+            removed = True
+        return removed
+    
+    def _confirm_lexicon_match(self, voice_command, match):
+        drone_action, phrase, distance = match
+        if distance == 0:
+            return True
+        answer = input(f"'{voice_command}' похоже на '{phrase}' → {drone_action}. Верно? (y/n): ").strip().lower()
+        return answer == 'y'
     
     def map_voice_to_action(self, voice_command, drone_action=None):
         if voice_command not in self.trainer.commands_db:
@@ -335,9 +1264,10 @@ class VoiceDroneController:
             return False
         
         if drone_action is None:
-            if voice_command.lower() in self.standard_mappings:
-                drone_action = self.standard_mappings[voice_command.lower()]
-                print(f"Использую стандартную привязку: '{voice_command}' → '{drone_action}'")
+            match = self.lexicon.lookup(voice_command)
+            if match and self._confirm_lexicon_match(voice_command, match):
+                drone_action, phrase, _ = match
+                print(f"Использую стандартную привязку: '{phrase}' → '{drone_action}'")
             else:
                 print("Неизвестная команда. Укажите действие дрона вручную.")
                 drone_action = input("Действие дрона (TAKEOFF/LAND/etc): ").strip().upper()
@@ -348,18 +1278,28 @@ class VoiceDroneController:
             return False
         
         self.command_mapping[voice_command] = drone_action
+        self.save_command_mapping()
+        
         print(f"Привязка создана: '{voice_command}' → '{drone_action}'")
         return True
     
     def execute_voice_command(self, voice_command):
         print(f"\nВыполнение команды: '{voice_command}'")
         
-        if voice_command not in self.command_mapping:
-            print(f"Команда '{voice_command}' не привязана к действию")
-            print("Сначала создайте привязку в меню (пункт 2)")
-            return False
+        if voice_command in self.command_mapping:
+            drone_action = self.command_mapping[voice_command]
+        else:
+            match = self.lexicon.lookup(voice_command)
+            if match is None:
+                print(f"Команда '{voice_command}' не привязана к действию")
+                print("Сначала создайте привязку в меню (пункт 2)")
+                return False
+            if not self._confirm_lexicon_match(voice_command, match):
+                print("Выполнение отменено")
+                return False
+            drone_action, phrase, _ = match
+            print(f"Распознано по словарю: '{phrase}'")
         
-        drone_action = self.command_mapping[voice_command]
         print(f"Действие дрона: {drone_action}")
         
         if self.commander.connect():
@@ -369,7 +1309,7 @@ class VoiceDroneController:
         
         return False
     
-    def execute_sequence(self, sequence_name, voice_command=None):
+    def execute_sequence(self, sequence_name, voice_command=None, upload=False):
         if voice_command is None:
             voice_command = sequence_name
         
@@ -399,12 +1339,36 @@ class VoiceDroneController:
                 commands.append((cmd, duration))
         
         if self.commander.connect():
-            success = self.commander.send_sequence(commands)
+            if upload:
+                success = (self.commander.upload_sequence(commands)
+                           and self.commander.wait_sequence(commands))
+            else:
+                success = self.commander.send_sequence(commands)
             self.commander.close()
             return success
         
         return False
     
+    def run_pipeline(self, n_clips=10):
+        return RecognitionPipeline(self).run(n_clips)
+    
+    def evaluate_recognition(self, corpus_dir, apply_thresholds=False):
+        evaluator = RecognitionEvaluator(self.trainer)
+        report = evaluator.evaluate(corpus_dir)
+        if report is None:
+            return None
+        
+        evaluator.print_report(report)
+        evaluator.save_report(report)
+        
+        if apply_thresholds:
+            self.trainer.high_confidence = report['recommended']['high']
+            self.trainer.medium_confidence = report['recommended']['medium']
+            self.trainer.save_thresholds()
+            print("Пороги уверенности обновлены")
+        
+        return report
+    
     def create_mission_xml(self, command_name, filename=None):
         """Создание XML файла миссии с автоматическим скачиванием"""
         if command_name not in self.trainer.commands_db:
@@ -430,34 +1394,28 @@ class VoiceDroneController:
         
         home_wp = ET.SubElement(waypoints, "waypoint")
         home_wp.set("id", "0")
-        ET.SubElement(home_wp, "lat").text = "0"
-        ET.SubElement(home_wp, "lon").text = "0"
+        ET.SubElement(home_wp, "lat").text = f"{self.planner.home[0]}"
+        ET.SubElement(home_wp, "lon").text = f"{self.planner.home[1]}"
         ET.SubElement(home_wp, "alt").text = "0"
         ET.SubElement(home_wp, "command").text = "16"
         
-        for i, movement in enumerate(movement_sequence, 1):
+        planned, summary = self.planner.plan(movement_sequence)
+        if planned is None:
+            return None
+        print(f"Маршрут: {summary['distance_m']:.1f} м, энергия {summary['energy_wh']:.2f} Вт*ч, "
+              f"планирование {summary['planning_ms']:.1f} мс")
+        
+        for i, point in enumerate(planned, 1):
             wp = ET.SubElement(waypoints, "waypoint")
             wp.set("id", str(i))
             
-            parts = movement.split(':')
-            cmd_type = parts[0].upper() if parts else "HOVER"
-            
-            mav_cmd = self._get_mavlink_command(cmd_type)
-            
-            ET.SubElement(wp, "lat").text = f"{i * 0.00001}"
-            ET.SubElement(wp, "lon").text = f"{i * 0.00001}"
-            ET.SubElement(wp, "alt").text = "10"
-            ET.SubElement(wp, "command").text = str(mav_cmd)
+            ET.SubElement(wp, "lat").text = f"{point['lat']:.7f}"
+            ET.SubElement(wp, "lon").text = f"{point['lon']:.7f}"
+            ET.SubElement(wp, "alt").text = f"{point['alt']:.2f}"
+            ET.SubElement(wp, "command").text = str(point['command'])
             
-            for param_num in range(1, 8):
-                ET.SubElement(wp, f"param{param_num}").text = "0"
-        
-        rtl_wp = ET.SubElement(waypoints, "waypoint")
-        rtl_wp.set("id", str(len(movement_sequence) + 1))
-        ET.SubElement(rtl_wp, "lat").text = "0"
-        ET.SubElement(rtl_wp, "lon").text = "0"
-        ET.SubElement(rtl_wp, "alt").text = "0"
-        ET.SubElement(rtl_wp, "command").text = "20"
+            for param_num, value in enumerate(point['params'], 1):
+                ET.SubElement(wp, f"param{param_num}").text = f"{value:g}"
         
         xml_str = minidom.parseString(ET.tostring(root)).toprettyxml(indent="  ")
         
@@ -590,195 +1548,833 @@ class VoiceDroneController:
         print("=" * 60)
         
         return success_count > 0
-    
-    def _get_mavlink_command(self, cmd_type):
-        mav_cmd_map = {
-            'TAKEOFF': 22,
-            'LAND': 21,
-            'HOVER': 16,
-            'FORWARD': 16,
-            'BACK': 16,
-            'LEFT': 16,
-            'RIGHT': 16,
-            'UP': 178,
-            'DOWN': 178,
-            'ROTATE_LEFT': 115,
-            'ROTATE_RIGHT': 115
-        }
-        
-        return mav_cmd_map.get(cmd_type, 16)
 
-def main_menu():
-    print("\n" + "=" * 60)
-    print("СИСТЕМА ГОЛОСОВОГО УПРАВЛЕНИЯ КВАДРОКОПТЕРОМ")
-    print("=" * 60)
-    print("Версия: 2.0 | Автоматическое скачивание XML")
-    print("=" * 60)
+class SharedRingBuffer:
+    """Кольцевой буфер в разделяемой памяти (один писатель, один читатель)"""
+    def __init__(self, slots, width, dtype=np.float32):
+        self.slots = slots
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        
+        data_size = slots * width * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=data_size + slots * 8)
+        
+        self._free = multiprocessing.Semaphore(slots)
+        self._filled = multiprocessing.Semaphore(0)
+        self._written = multiprocessing.Value('Q', 0)
+        self._read = multiprocessing.Value('Q', 0)
+        self.dropped = multiprocessing.Value('Q', 0)
+        self.max_depth = multiprocessing.Value('Q', 0)
+        self.closed = multiprocessing.Event()
+        # Читатель завершился: писать в буфер больше некому
+        self.abandoned = multiprocessing.Event()
+        
+        self._attach()
     
-    controller = VoiceDroneController()
+    def _attach(self):
+        data_size = self.slots * self.width * self.dtype.itemsize
+        self._data = np.ndarray((self.slots, self.width), dtype=self.dtype, buffer=self._shm.buf)
+        self._ids = np.ndarray((self.slots,), dtype=np.int64, buffer=self._shm.buf, offset=data_size)
     
-    while True:
-        print("\n" + "=" * 50)
-        print("ГЛАВНОЕ МЕНЮ")
-        print("=" * 50)
-        print("1. Обучить новую голосовую команду")
-        print("2. Привязать команду к действию дрона")
-        print("3. Показать все команды")
-        print("4. Тестировать распознавание")
-        print("5. Выполнить голосовую команду")
-        print("6. Выполнить последовательность")
-        print("7. Создать и скачать XML миссию (1 команда)")
-        print("8. Пакетное создание миссий (несколько команд)")
-        print("9. Удалить команду")
-        print("0. Выход")
-        print("=" * 50)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_data']
+        del state['_ids']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+    
+    def depth(self):
+        return self._written.value - self._read.value
+    
+    def put(self, data, item_id, block=True, timeout=None):
+        if not self._free.acquire(block, timeout):
+            if not block:
+                with self.dropped.get_lock():
+                    self.dropped.value += 1
+            return False
         
-        choice = input("\nВыберите действие (0-9): ").strip()
+        slot = self._written.value % self.slots
+        n = min(len(data), self.width)
+        self._data[slot, :n] = data[:n]
+        self._data[slot, n:] = 0
+        self._ids[slot] = item_id
         
-        if choice == '1':
-            print("\n" + "=" * 50)
-            print("ОБУЧЕНИЕ НОВОЙ КОМАНДЫ")
-            print("=" * 50)
+        with self._written.get_lock():
+            self._written.value += 1
+        
+        depth = self.depth()
+        if depth > self.max_depth.value:
+            self.max_depth.value = depth
+        
+        self._filled.release()
+        return True
+    
+    def get(self, timeout=0.1):
+        if not self._filled.acquire(True, timeout):
+            return None
+        
+        slot = self._read.value % self.slots
+        data = self._data[slot].copy()
+        item_id = int(self._ids[slot])
+        
+        with self._read.get_lock():
+            self._read.value += 1
+        self._free.release()
+        
+        return item_id, data
+    
+    def get_batch(self, max_items, timeout=0.1):
+        first = self.get(timeout)
+        if first is None:
+            return []
+        
+        batch = [first]
+        while len(batch) < max_items:
+            item = self.get(0)
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+    
+    def exhausted(self):
+        return self.closed.is_set() and self.depth() == 0
+    
+    def release(self, unlink=False):
+        self._data = None
+        self._ids = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+def _put_with_backpressure(ring, data, item_id, stop_event):
+    while not stop_event.is_set() and not ring.abandoned.is_set():
+        if ring.put(data, item_id, timeout=0.1):
+            return True
+    return False
+
+def _capture_stage(trainer, audio_ring, n_clips, interval, vad_threshold, stop_event):
+    try:
+        clip_id = 0
+        while not stop_event.is_set() and not audio_ring.abandoned.is_set() and clip_id < n_clips:
+            audio = trainer._generate_test_audio(trainer.sample_duration)
+            clip_id += 1
             
-            command_name = input("Введите название команды (например 'Взлет'): ").strip()
+            # Простейший VAD по энергии; захват никогда не ждет следующие этапы
+            if np.sqrt(np.mean(audio ** 2)) >= vad_threshold:
+                audio_ring.put(audio, clip_id, block=False)
             
-            if not command_name:
-                print("Название команды не может быть пустым")
-                continue
+            time.sleep(interval)
+    finally:
+        audio_ring.closed.set()
+
+def _feature_stage(trainer, audio_ring, feature_ring, batch_size, noise_request, stop_event):
+    try:
+        while not stop_event.is_set():
+            # ARM отправлен этапом отправки: профиль шума нужен в этом процессе
+            if noise_request.is_set():
+                noise_request.clear()
+                trainer.capture_noise_profile()
             
-            print("\nНастройка последовательности движений (опционально):")
-            print("Формат: КОМАНДА:ДЛИТЕЛЬНОСТЬ_MS")
-            print("Примеры: TAKEOFF:2000, FORWARD:1000, HOVER:500")
-            print("Оставьте пустым, если не нужно настраивать последовательность")
+            batch = audio_ring.get_batch(batch_size)
+            if not batch:
+                if audio_ring.exhausted():
+                    break
+                continue
             
-            movements = []
-            while True:
-                move = input(f"Движение {len(movements) + 1} (или Enter для завершения): ").strip()
-                if not move:
+            clips = trainer.conditioner.process_batch(np.stack([audio for _, audio in batch]))
+            for (clip_id, _), audio in zip(batch, clips):
+                features = trainer.extract_mfcc_features(audio, n_mfcc=feature_ring.width)
+                if not _put_with_backpressure(feature_ring, features, clip_id, stop_event):
+                    return
+    finally:
+        audio_ring.abandoned.set()
+        feature_ring.closed.set()
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def _matching_stage(feature_ring, result_ring, voiceprints, threshold, batch_size, stop_event):
+    voiceprints = _normalize_rows(voiceprints)
+    
+    try:
+        while not stop_event.is_set():
+            batch = feature_ring.get_batch(batch_size)
+            if not batch:
+                if feature_ring.exhausted():
                     break
-                
-                if ':' not in move:
-                    print("Неверный формат. Используйте: КОМАНДА:ДЛИТЕЛЬНОСТЬ")
+                continue
+            
+            similarity = _normalize_rows(np.stack([f for _, f in batch])) @ voiceprints.T
+            best = np.argmax(similarity, axis=1)
+            
+            for (clip_id, _), idx, row in zip(batch, best, similarity):
+                if row[idx] < threshold:
                     continue
-                
-                movements.append(move)
-                print(f"Добавлено: {move}")
+                if not _put_with_backpressure(result_ring, np.array([idx, row[idx]]), clip_id, stop_event):
+                    return
+    finally:
+        feature_ring.abandoned.set()
+        result_ring.closed.set()
+
+def _dispatch_stage(result_ring, names, command_mapping, lexicon, commander, noise_request, stop_event):
+    commander.on_arm = noise_request.set
+    
+    try:
+        if not commander.connect():
+            print("Этап отправки: нет соединения с Arduino")
+            sys.exit(1)
+        
+        while not stop_event.is_set():
+            item = result_ring.get()
+            if item is None:
+                if result_ring.exhausted():
+                    break
+                continue
             
-            print(f"\nВсего движений: {len(movements)}")
+            clip_id, (idx, similarity) = item
+            name = names[int(idx)]
+            action = command_mapping.get(name)
+            if action is None:
+                # Без подтверждения оператора - только точное совпадение
+                match = lexicon.lookup(name, max_distance=0)
+                action = match[0] if match else None
             
-            confirm = input("\nНачать обучение? (y/n): ").strip().lower()
-            if confirm == 'y':
-                success = controller.trainer.train_new_command(command_name, movements)
-                if success:
-                    if command_name.lower() in controller.standard_mappings:
-                        auto_map = input(f"\nАвтоматически привязать к действию '{controller.standard_mappings[command_name.lower()]}'? (y/n): ").strip().lower()
-                        if auto_map == 'y':
-                            controller.map_voice_to_action(command_name)
+            print(f"[{clip_id}] '{name}' ({similarity:.3f}) → {action or 'нет привязки'}")
+            if action:
+                commander.send_command(action)
+    finally:
+        result_ring.abandoned.set()
+        commander.close()
+
+class RecognitionPipeline:
+    """Многопроцессный конвейер: захват/VAD → признаки → сопоставление → отправка"""
+    def __init__(self, controller, slots=8, batch_size=4, similarity_threshold=None):
+        self.controller = controller
+        self.slots = slots
+        self.batch_size = batch_size
+        # По умолчанию - порог средней уверенности (в т.ч. подобранный оценкой)
+        if similarity_threshold is None:
+            similarity_threshold = controller.trainer.medium_confidence
+        self.similarity_threshold = similarity_threshold
+        self.vad_threshold = 0.01
+        self.rings = {}
+    
+    def print_metrics(self):
+        for stage, ring in self.rings.items():
+            print(f"  {stage:10s} очередь {ring.depth()}/{ring.slots} "
+                  f"(макс {ring.max_depth.value}), передано {ring._written.value}, "
+                  f"отброшено {ring.dropped.value}")
+    
+    def run(self, n_clips=10, capture_interval=0.2, report_interval=1.0):
+        trainer = self.controller.trainer
+        if not trainer.commands_db:
+            print("Нет обученных команд для распознавания")
+            return False
         
-        elif choice == '2':
-            print("\n" + "=" * 50)
-            print("ПРИВЯЗКА КОМАНДЫ К ДЕЙСТВИЮ")
-            print("=" * 50)
+        names = list(trainer.commands_db.keys())
+        voiceprints = np.array([trainer.commands_db[name]['voiceprint'] for name in names])
+        clip_len = int(trainer.sample_duration * trainer.sample_rate)
+        
+        self.rings = {
+            'audio': SharedRingBuffer(self.slots, clip_len),
+            'features': SharedRingBuffer(self.slots, voiceprints.shape[1]),
+            'matches': SharedRingBuffer(self.slots, 2, dtype=np.float64),
+        }
+        stop_event = multiprocessing.Event()
+        noise_request = multiprocessing.Event()
+        
+        processes = [
+            multiprocessing.Process(target=_capture_stage, name='capture', daemon=True,
+                                    args=(trainer, self.rings['audio'], n_clips, capture_interval,
+                                          self.vad_threshold, stop_event)),
+            multiprocessing.Process(target=_feature_stage, name='features', daemon=True,
+                                    args=(trainer, self.rings['audio'], self.rings['features'],
+                                          self.batch_size, noise_request, stop_event)),
+            multiprocessing.Process(target=_matching_stage, name='matching', daemon=True,
+                                    args=(self.rings['features'], self.rings['matches'], voiceprints,
+                                          self.similarity_threshold, self.batch_size, stop_event)),
+            multiprocessing.Process(target=_dispatch_stage, name='dispatch', daemon=True,
+                                    args=(self.rings['matches'], names, self.controller.command_mapping,
+                                          self.controller.lexicon, self.controller.commander,
+                                          noise_request, stop_event)),
+        ]
+        
+        inputs = {'features': self.rings['audio'], 'matching': self.rings['features'],
+                  'dispatch': self.rings['matches']}
+        
+        print(f"\nЗапуск конвейера: {len(processes)} процессов, {n_clips} записей")
+        start = time.time()
+        failed = False
+        previous_sigterm = os_signal.getsignal(os_signal.SIGTERM)
+        
+        try:
+            for process in processes:
+                process.start()
             
-            controller.trainer.list_commands()
+            # SIGTERM завершает конвейер так же, как Ctrl+C: с освобождением памяти
+            os_signal.signal(os_signal.SIGTERM, os_signal.default_int_handler)
             
-            if controller.trainer.commands_db:
-                voice_cmd = input("\nВведите голосовую команду: ").strip()
+            while any(process.is_alive() for process in processes):
+                for process in processes:
+                    process.join(report_interval / len(processes))
+                print(f"\n[{time.time() - start:.1f} с] Состояние очередей:")
+                self.print_metrics()
                 
-                if voice_cmd not in controller.trainer.commands_db:
-                    print(f"Команда '{voice_cmd}' не найдена")
+                if stop_event.is_set():
                     continue
-                
-                print("\nСтандартные действия дрона:")
-                for voice, action in controller.standard_mappings.items():
-                    print(f"  {voice:15s} → {action}")
-                
-                print("\nВведите действие дрона или оставьте пустым для стандартной привязки")
-                drone_action = input("Действие дрона: ").strip().upper()
-                
-                if drone_action:
-                    controller.map_voice_to_action(voice_cmd, drone_action)
-                else:
-                    controller.map_voice_to_action(voice_cmd)
-        
-        elif choice == '3':
-            print("\n" + "=" * 50)
-            print("СПИСОК ВСЕХ КОМАНД")
-            print("=" * 50)
-            controller.trainer.list_commands()
+                for process in sorted(processes, key=lambda p: p.exitcode in (None, 0)):
+                    early = (process.exitcode == 0 and process.name in inputs
+                             and not inputs[process.name].exhausted())
+                    if process.exitcode not in (None, 0) or early:
+                        print(f"Этап '{process.name}' завершился досрочно (код {process.exitcode}), "
+                              f"остановка конвейера")
+                        failed = True
+                        stop_event.set()
+                        break
+        except KeyboardInterrupt:
+            print("\nОстановка конвейера...")
+        finally:
+            os_signal.signal(os_signal.SIGTERM, previous_sigterm)
+            stop_event.set()
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
             
-            if controller.command_mapping:
-                print("\nПРИВЯЗКИ КОМАНД:")
-                print("-" * 40)
-                for voice_cmd, drone_action in controller.command_mapping.items():
-                    print(f"  {voice_cmd:15s} → {drone_action}")
+            print(f"\nКонвейер завершен за {time.time() - start:.1f} с")
+            self.print_metrics()
+            
+            for ring in self.rings.values():
+                ring.release(unlink=True)
+            self.rings = {}
         
-        elif choice == '4':
-            print("\n" + "=" * 50)
-            print("ТЕСТИРОВАНИЕ РАСПОЗНАВАНИЯ")
-            print("=" * 50)
-            controller.trainer.test_recognition()
+        return not failed
+
+_EVALUATION_STATE = {}
+
+def _init_evaluation_worker(trainer, voiceprints, warmup_path):
+    _EVALUATION_STATE['trainer'] = trainer
+    _EVALUATION_STATE['voiceprints'] = _normalize_rows(voiceprints)
+    
+    # Ленивая загрузка librosa и кэши фильтров не должны попасть в задержку первой записи
+    _evaluate_clip(warmup_path)
+
+def _evaluate_clip(path):
+    trainer = _EVALUATION_STATE['trainer']
+    voiceprints = _EVALUATION_STATE['voiceprints']
+    
+    start = time.perf_counter()
+    try:
+        audio, _ = librosa.load(path, sr=trainer.sample_rate)
+    except Exception as e:
+        print(f"Ошибка чтения {path}: {e}")
+        return None, 0.0
+    
+    audio = trainer.conditioner.process_batch(audio)
+    features = trainer.extract_mfcc_features(audio, n_mfcc=voiceprints.shape[1])
+    scores = _normalize_rows(features[np.newaxis, :]) @ voiceprints.T
+    
+    return scores[0], time.perf_counter() - start
+
+class RecognitionEvaluator:
+    """Оценка распознавания на размеченном корпусе WAV: <корпус>/<команда>/*.wav"""
+    def __init__(self, trainer, workers=None, thresholds=None):
+        self.trainer = trainer
+        self.workers = workers or os.cpu_count() or 1
+        self.thresholds = thresholds if thresholds is not None else np.round(np.linspace(0, 1, 21), 2)
+        self.max_false_accept = 0.01
+    
+    def _scan_corpus(self, corpus_dir):
+        paths, labels = [], []
+        for label in sorted(os.listdir(corpus_dir)):
+            label_dir = os.path.join(corpus_dir, label)
+            if not os.path.isdir(label_dir):
+                continue
+            for filename in sorted(os.listdir(label_dir)):
+                if filename.lower().endswith('.wav'):
+                    paths.append(os.path.join(label_dir, filename))
+                    labels.append(label)
+        return paths, labels
+    
+    def evaluate(self, corpus_dir, top_k=(1, 3)):
+        if not self.trainer.commands_db:
+            print("Нет обученных команд для оценки")
+            return None
         
-        elif choice == '5':
-            print("\n" + "=" * 50)
-            print("ВЫПОЛНЕНИЕ ГОЛОСОВОЙ КОМАНДЫ")
-            print("=" * 50)
+        if not os.path.isdir(corpus_dir):
+            print(f"Папка корпуса не найдена: {corpus_dir}")
+            return None
+        
+        paths, labels = self._scan_corpus(corpus_dir)
+        if not paths:
+            print(f"В корпусе {corpus_dir} нет WAV файлов")
+            return None
+        
+        names = list(self.trainer.commands_db.keys())
+        voiceprints = np.array([self.trainer.commands_db[name]['voiceprint'] for name in names])
+        
+        print(f"\nОценка: {len(paths)} записей, {len(names)} команд, {self.workers} процессов")
+        start = time.time()
+        
+        chunksize = max(1, len(paths) // (self.workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_evaluation_worker,
+                                                    initargs=(self.trainer, voiceprints, paths[0])) as pool:
+            results = list(pool.map(_evaluate_clip, paths, chunksize=chunksize))
+        
+        valid = [i for i, (scores, _) in enumerate(results) if scores is not None]
+        if not valid:
+            print("Не удалось обработать ни одной записи")
+            return None
+        
+        scores = np.stack([results[i][0] for i in valid])
+        latencies = np.array([results[i][1] for i in valid]) * 1000.0
+        # Метки, которых нет среди обученных команд, - посторонние записи (-1)
+        name_index = {name: i for i, name in enumerate(names)}
+        truth = np.array([name_index.get(labels[i], -1) for i in valid])
+        
+        report = self._compute_metrics(scores, truth, top_k)
+        report.update({
+            'names': names,
+            'clips': len(valid),
+            'failed': len(paths) - len(valid),
+            'latency_ms': dict(zip(('p50', 'p90', 'p99'), np.percentile(latencies, [50, 90, 99]))),
+            'elapsed_s': time.time() - start,
+        })
+        return report
+    
+    def _compute_metrics(self, scores, truth, top_k):
+        n_commands = scores.shape[1]
+        known = truth >= 0
+        best = scores.max(axis=1)
+        predicted = scores.argmax(axis=1)
+        correct = predicted == truth
+        
+        ranking = np.argsort(-scores, axis=1)
+        top_k_accuracy = {
+            k: float((ranking[known, :k] == truth[known, np.newaxis]).any(axis=1).mean()) if known.any() else 0.0
+            for k in top_k
+        }
+        
+        # Кривые ошибок: строки - пороги, столбцы - записи
+        accepted = best[np.newaxis, :] >= self.thresholds[:, np.newaxis]
+        false_accept = (accepted & ~correct[np.newaxis, :]).mean(axis=1)
+        false_reject = ((~accepted[:, known]).mean(axis=1) if known.any()
+                        else np.zeros(len(self.thresholds)))
+        
+        eer_idx = int(np.argmin(np.abs(false_accept - false_reject)))
+        strict = np.flatnonzero(false_accept <= self.max_false_accept)
+        strict_idx = int(strict[0]) if len(strict) else len(self.thresholds) - 1
+        # Высокая уверенность не может начинаться ниже средней
+        strict_idx = max(strict_idx, eer_idx)
+        
+        # Матрица ошибок при пороге EER: последний столбец - отказ,
+        # последняя строка - посторонние записи
+        threshold = self.thresholds[eer_idx]
+        confusion = np.zeros((n_commands + 1, n_commands + 1), dtype=np.int64)
+        predicted_at = np.where(best >= threshold, predicted, n_commands)
+        np.add.at(confusion, (np.where(known, truth, n_commands), predicted_at), 1)
+        
+        return {
+            'confusion': confusion,
+            'confusion_threshold': float(threshold),
+            'top_k_accuracy': top_k_accuracy,
+            'thresholds': self.thresholds,
+            'false_accept': false_accept,
+            'false_reject': false_reject,
+            'recommended': {
+                'high': float(self.thresholds[strict_idx]),
+                'medium': float(threshold),
+            },
+        }
+    
+    def print_report(self, report):
+        names = report['names']
+        print("\nРЕЗУЛЬТАТЫ ОЦЕНКИ")
+        print("=" * 60)
+        print(f"Записей: {report['clips']} (ошибок чтения: {report['failed']}), "
+              f"время {report['elapsed_s']:.1f} с")
+        
+        for k, accuracy in report['top_k_accuracy'].items():
+            print(f"Top-{k} точность: {accuracy:.3f}")
+        
+        latency = report['latency_ms']
+        print(f"Задержка на запись, мс: p50 {latency['p50']:.1f}, p90 {latency['p90']:.1f}, p99 {latency['p99']:.1f}")
+        
+        print("\nПорог   FA      FR")
+        print("-" * 22)
+        for threshold, fa, fr in zip(report['thresholds'], report['false_accept'], report['false_reject']):
+            print(f"{threshold:5.2f}  {fa:6.3f}  {fr:6.3f}")
+        
+        print(f"\nМатрица ошибок (порог {report['confusion_threshold']:.2f}):")
+        columns = names + ['отказ']
+        rows = names + ['посторонние']
+        print(" " * 15 + "".join(f"{name[:8]:>9s}" for name in columns))
+        for name, row in zip(rows, report['confusion']):
+            print(f"{name[:15]:15s}" + "".join(f"{value:9d}" for value in row))
+        
+        recommended = report['recommended']
+        print(f"\nРекомендуемые пороги: ВЫСОКАЯ >= {recommended['high']:.2f} "
+              f"(FA <= {self.max_false_accept:.0%}), СРЕДНЯЯ >= {recommended['medium']:.2f} (EER)")
+    
+    def save_report(self, report, filename=None):
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.trainer.data_dir, f"evaluation_{timestamp}.npz")
+        
+        latency = report['latency_ms']
+        np.savez(filename,
+                 names=np.array(report['names']),
+                 clips=report['clips'],
+                 failed=report['failed'],
+                 elapsed_s=report['elapsed_s'],
+                 top_k=np.array(list(report['top_k_accuracy'].keys())),
+                 top_k_accuracy=np.array(list(report['top_k_accuracy'].values())),
+                 latency_percentiles=np.array([50, 90, 99]),
+                 latency_ms=np.array([latency['p50'], latency['p90'], latency['p99']]),
+                 confusion=report['confusion'],
+                 confusion_threshold=report['confusion_threshold'],
+                 thresholds=report['thresholds'],
+                 false_accept=report['false_accept'],
+                 false_reject=report['false_reject'],
+                 max_false_accept=self.max_false_accept,
+                 recommended_high=report['recommended']['high'],
+                 recommended_medium=report['recommended']['medium'])
+        print(f"Отчет сохранен: {filename}")
+        return filename
+
+class ActionProfiler:
+    """Профилирование пунктов меню: cProfile, tracemalloc, время и пик памяти"""
+    ACTION_NAMES = {
+        '1': 'train_command',
+        '2': 'map_command',
+        '3': 'list_commands',
+        '4': 'test_recognition',
+        '5': 'execute_command',
+        '6': 'execute_sequence',
+        '7': 'create_mission',
+        '8': 'batch_create_missions',
+        '9': 'delete_command',
+        '10': 'run_pipeline',
+        '11': 'evaluate_recognition',
+    }
+    
+    def __init__(self, profile_dir='profiles'):
+        self.profile_dir = profile_dir
+        self._report_count = 0
+        
+        if not os.path.exists(profile_dir):
+            os.makedirs(profile_dir)
+    
+    def run(self, choice, func, *args, **kwargs):
+        action = self.ACTION_NAMES.get(choice, 'unknown')
+        
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        
+        profile = cProfile.Profile()
+        prompt_time = [0.0]
+        original_input = builtins.input
+        
+        # Ожидание ввода оператора не входит ни в профиль, ни во время действия
+        def unprofiled_input(*input_args):
+            profile.disable()
+            prompt_start = time.perf_counter()
+            try:
+                return original_input(*input_args)
+            finally:
+                prompt_time[0] += time.perf_counter() - prompt_start
+                profile.enable()
+        
+        builtins.input = unprofiled_input
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            wall_time = time.perf_counter() - wall_start - prompt_time[0]
+            cpu_time = time.process_time() - cpu_start
+            builtins.input = original_input
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
             
-            controller.trainer.list_commands()
+            self._write_report(action, profile, wall_time, cpu_time, peak)
+    
+    def _write_report(self, action, profile, wall_time, cpu_time, peak):
+        # Миллисекунды и номер отчета: повторы в ту же секунду не перезаписывают файлы
+        self._report_count += 1
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        base = os.path.join(self.profile_dir, f"{timestamp}_{self._report_count:03d}_{action}")
+        
+        stats = pstats.Stats(profile)
+        stats.dump_stats(base + '.pstats')
+        
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, value in self._collapse_stacks(stats.stats):
+                f.write(f"{stack} {value}\n")
+        
+        summary_file = os.path.join(self.profile_dir, 'summary.csv')
+        new_file = not os.path.exists(summary_file)
+        with open(summary_file, 'a', encoding='utf-8') as f:
+            if new_file:
+                f.write("timestamp,action,wall_s,cpu_s,peak_kb\n")
+            f.write(f"{timestamp},{action},{wall_time:.6f},{cpu_time:.6f},{peak / 1024:.1f}\n")
+        
+        print(f"\n[profile] {action}: стена {wall_time:.3f} с, CPU {cpu_time:.3f} с, "
+              f"пик памяти {peak / 1024:.1f} КБ → {base}.pstats")
+    
+    @staticmethod
+    def _frame_name(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})"
+    
+    def _collapse_stacks(self, raw_stats, max_depth=64):
+        # Стеки восстанавливаются по графу вызовов cProfile: время функции
+        # делится между путями пропорционально времени вызовов по каждому ребру
+        children = {}
+        roots = []
+        for func, (_, _, _, _, callers) in raw_stats.items():
+            if not callers:
+                roots.append(func)
+            for caller, edge in callers.items():
+                children.setdefault(caller, []).append((func, edge[3]))
+        
+        collapsed = {}
+        stack = [(root, 1.0, (self._frame_name(root),)) for root in roots]
+        while stack:
+            func, share, path = stack.pop()
+            value = int(raw_stats[func][2] * share * 1e6)
+            if value > 0:
+                key = ';'.join(path)
+                collapsed[key] = collapsed.get(key, 0) + value
             
-            if controller.trainer.commands_db:
-                voice_cmd = input("\nВведите голосовую команду для выполнения: ").strip()
-                controller.execute_voice_command(voice_cmd)
+            if len(path) >= max_depth:
+                continue
+            for child, edge_time in children.get(func, []):
+                name = self._frame_name(child)
+                total_time = raw_stats[child][3]
+                if name in path or total_time <= 0:
+                    continue
+                stack.append((child, min(1.0, edge_time * share / total_time), path + (name,)))
         
-        elif choice == '6':
-            print("\n" + "=" * 50)
-            print("ВЫПОЛНЕНИЕ ПОСЛЕДОВАТЕЛЬНОСТИ")
-            print("=" * 50)
+        return sorted(collapsed.items())
+
+def handle_menu_choice(controller, choice):
+    """Выполнение пункта меню; False - без паузы перед возвратом в меню"""
+    if choice == '1':
+        print("\n" + "=" * 50)
+        print("ОБУЧЕНИЕ НОВОЙ КОМАНДЫ")
+        print("=" * 50)
+        
+        command_name = input("Введите название команды (например 'Взлет'): ").strip()
+        
+        if not command_name:
+            print("Название команды не может быть пустым")
+            return False
+        
+        print("\nНастройка последовательности движений (опционально):")
+        print("Формат: КОМАНДА:ДЛИТЕЛЬНОСТЬ_MS")
+        print("Примеры: TAKEOFF:2000, FORWARD:1000, HOVER:500")
+        print("Оставьте пустым, если не нужно настраивать последовательность")
+        
+        movements = []
+        while True:
+            move = input(f"Движение {len(movements) + 1} (или Enter для завершения): ").strip()
+            if not move:
+                break
             
-            controller.trainer.list_commands()
+            if ':' not in move:
+                print("Неверный формат. Используйте: КОМАНДА:ДЛИТЕЛЬНОСТЬ")
+                continue
             
-            if controller.trainer.commands_db:
-                voice_cmd = input("\nВведите голосовую команду с последовательностью: ").strip()
-                controller.execute_sequence(voice_cmd)
+            movements.append(move)
+            print(f"Добавлено: {move}")
+        
+        print(f"\nВсего движений: {len(movements)}")
+        
+        confirm = input("\nНачать обучение? (y/n): ").strip().lower()
+        if confirm == 'y':
+            success = controller.trainer.train_new_command(command_name, movements)
+            if success:
+                match = controller.lexicon.lookup(command_name)
+                if match:
+                    auto_map = input(f"\nАвтоматически привязать к действию '{match[0]}' (фраза '{match[1]}')? (y/n): ").strip().lower()
+                    if auto_map == 'y':
+                        controller.map_voice_to_action(command_name, match[0])
+    
+    elif choice == '2':
+        print("\n" + "=" * 50)
+        print("ПРИВЯЗКА КОМАНДЫ К ДЕЙСТВИЮ")
+        print("=" * 50)
         
-        elif choice == '7':
-            print("\n" + "=" * 50)
-            print("СОЗДАНИЕ И СКАЧИВАНИЕ XML МИССИИ")
-            print("=" * 50)
+        controller.trainer.list_commands()
+        
+        if controller.trainer.commands_db:
+            voice_cmd = input("\nВведите голосовую команду: ").strip()
             
-            controller.trainer.list_commands()
+            if voice_cmd not in controller.trainer.commands_db:
+                print(f"Команда '{voice_cmd}' не найдена")
+                return False
             
-            if controller.trainer.commands_db:
-                voice_cmd = input("\nВведите голосовую команду для создания миссии: ").strip()
-                
-                if voice_cmd in controller.trainer.commands_db:
-                    controller.create_and_download_mission(voice_cmd)
-                else:
-                    print(f"Команда '{voice_cmd}' не найдена")
-        
-        elif choice == '8':
-            print("\n" + "=" * 50)
-            print("ПАКЕТНОЕ СОЗДАНИЕ МИССИЙ")
-            print("=" * 50)
+            print("\nСловарь действий дрона:")
+            for action, phrases in controller.lexicon.phrases_by_action().items():
+                print(f"  {action:12s} ← {', '.join(phrases)}")
             
-            controller.batch_create_missions()
+            print("\nВведите действие дрона или оставьте пустым для стандартной привязки")
+            drone_action = input("Действие дрона: ").strip().upper()
+            
+            if drone_action:
+                success = controller.map_voice_to_action(voice_cmd, drone_action)
+            else:
+                success = controller.map_voice_to_action(voice_cmd)
+            
+            # Синонимы и словоформы оператора сохраняются в lexicon.pkl
+            drone_action = controller.command_mapping.get(voice_cmd)
+            exact = controller.lexicon.lookup(voice_cmd, max_distance=0)
+            if success and (exact is None or exact[0] != drone_action):
+                save = input(f"Добавить '{voice_cmd}' в словарь как фразу для {drone_action}? (y/n): ").strip().lower()
+                if save == 'y' and controller.lexicon.add_phrase(voice_cmd, drone_action):
+                    print(f"Фраза '{voice_cmd}' добавлена в словарь")
+    
+    elif choice == '3':
+        print("\n" + "=" * 50)
+        print("СПИСОК ВСЕХ КОМАНД")
+        print("=" * 50)
+        controller.trainer.list_commands()
         
-        elif choice == '9':
-            print("\n" + "=" * 50)
-            print("УДАЛЕНИЕ КОМАНДЫ")
-            print("=" * 50)
+        if controller.command_mapping:
+            print("\nПРИВЯЗКИ КОМАНД:")
+            print("-" * 40)
+            for voice_cmd, drone_action in controller.command_mapping.items():
+                print(f"  {voice_cmd:15s} → {drone_action}")
+    
+    elif choice == '4':
+        print("\n" + "=" * 50)
+        print("ТЕСТИРОВАНИЕ РАСПОЗНАВАНИЯ")
+        print("=" * 50)
+        controller.trainer.test_recognition()
+    
+    elif choice == '5':
+        print("\n" + "=" * 50)
+        print("ВЫПОЛНЕНИЕ ГОЛОСОВОЙ КОМАНДЫ")
+        print("=" * 50)
+        
+        controller.trainer.list_commands()
+        
+        if controller.trainer.commands_db:
+            voice_cmd = input("\nВведите голосовую команду для выполнения: ").strip()
+            controller.execute_voice_command(voice_cmd)
+    
+    elif choice == '6':
+        print("\n" + "=" * 50)
+        print("ВЫПОЛНЕНИЕ ПОСЛЕДОВАТЕЛЬНОСТИ")
+        print("=" * 50)
+        
+        controller.trainer.list_commands()
+        
+        if controller.trainer.commands_db:
+            voice_cmd = input("\nВведите голосовую команду с последовательностью: ").strip()
+            upload = input("Загрузить последовательность в контроллер целиком? (y/n): ").strip().lower()
+            controller.execute_sequence(voice_cmd, upload=(upload == 'y'))
+    
+    elif choice == '7':
+        print("\n" + "=" * 50)
+        print("СОЗДАНИЕ И СКАЧИВАНИЕ XML МИССИИ")
+        print("=" * 50)
+        
+        controller.trainer.list_commands()
+        
+        if controller.trainer.commands_db:
+            voice_cmd = input("\nВведите голосовую команду для создания миссии: ").strip()
             
-            controller.trainer.list_commands()
+            if voice_cmd in controller.trainer.commands_db:
+                controller.create_and_download_mission(voice_cmd)
+            else:
+                print(f"Команда '{voice_cmd}' не найдена")
+    
+    elif choice == '8':
+        print("\n" + "=" * 50)
+        print("ПАКЕТНОЕ СОЗДАНИЕ МИССИЙ")
+        print("=" * 50)
+        
+        controller.batch_create_missions()
+    
+    elif choice == '9':
+        print("\n" + "=" * 50)
+        print("УДАЛЕНИЕ КОМАНДЫ")
+        print("=" * 50)
+        
+        controller.trainer.list_commands()
+        
+        if controller.trainer.commands_db:
+            voice_cmd = input("\nВведите голосовую команду для удаления: ").strip()
+            controller.trainer.delete_command(voice_cmd)
             
-            if controller.trainer.commands_db:
-                voice_cmd = input("\nВведите голосовую команду для удаления: ").strip()
-                controller.trainer.delete_command(voice_cmd)
-                
-                if voice_cmd in controller.command_mapping:
-                    del controller.command_mapping[voice_cmd]
-                    print(f"Привязка для '{voice_cmd}' также удалена")
+            if controller.remove_mapping(voice_cmd):
+                print(f"Привязка для '{voice_cmd}' также удалена")
+    
+    elif choice == '10':
+        print("\n" + "=" * 50)
+        print("КОНВЕЙЕРНОЕ РАСПОЗНАВАНИЕ")
+        print("=" * 50)
+        
+        n_clips = input("Количество записей (по умолчанию 10): ").strip()
+        controller.run_pipeline(int(n_clips) if n_clips.isdigit() else 10)
+    
+    elif choice == '11':
+        print("\n" + "=" * 50)
+        print("ОЦЕНКА РАСПОЗНАВАНИЯ")
+        print("=" * 50)
+        print("Структура корпуса: <папка>/<название команды>/*.wav")
+        
+        corpus_dir = input("Папка корпуса: ").strip()
+        if corpus_dir:
+            apply = input("Применить рекомендованные пороги? (y/n): ").strip().lower()
+            controller.evaluate_recognition(corpus_dir, apply_thresholds=(apply == 'y'))
+    
+    else:
+        print("Неверный выбор. Попробуйте снова.")
+    
+    return True
+
+def main_menu(profiler=None):
+    print("\n" + "=" * 60)
+    print("СИСТЕМА ГОЛОСОВОГО УПРАВЛЕНИЯ КВАДРОКОПТЕРОМ")
+    print("=" * 60)
+    print("Версия: 2.0 | Автоматическое скачивание XML")
+    print("=" * 60)
+    
+    controller = VoiceDroneController()
+    
+    while True:
+        print("\n" + "=" * 50)
+        print("ГЛАВНОЕ МЕНЮ")
+        print("=" * 50)
+        print("1. Обучить новую голосовую команду")
+        print("2. Привязать команду к действию дрона")
+        print("3. Показать все команды")
+        print("4. Тестировать распознавание")
+        print("5. Выполнить голосовую команду")
+        print("6. Выполнить последовательность")
+        print("7. Создать и скачать XML миссию (1 команда)")
+        print("8. Пакетное создание миссий (несколько команд)")
+        print("9. Удалить команду")
+        print("10. Конвейерное распознавание (многопроцессный режим)")
+        print("11. Оценка распознавания по корпусу WAV")
+        print("0. Выход")
+        print("=" * 50)
         
-        elif choice == '0':
+        choice = input("\nВыберите действие (0-11): ").strip()
+        
+        if choice == '0':
             print("\n" + "=" * 50)
             print("ВЫХОД ИЗ СИСТЕМЫ")
             print("=" * 50)
@@ -786,12 +2382,29 @@ def main_menu():
             print("Все созданные XML файлы находятся в текущей директории")
             break
         
+        if profiler is None:
+            show_pause = handle_menu_choice(controller, choice)
         else:
-            print("Неверный выбор. Попробуйте снова.")
+            show_pause = profiler.run(choice, handle_menu_choice, controller, choice)
         
-        input("\nНажмите Enter для продолжения...")
+        if show_pause:
+            input("\nНажмите Enter для продолжения...")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Голосовое управление квадрокоптером")
+    parser.add_argument('--profile', action='store_true',
+                        help="профилировать каждый пункт меню (cProfile + tracemalloc)")
+    parser.add_argument('--profile-dir', default='profiles',
+                        help="папка для отчетов профилирования")
+    parser.add_argument('--evaluate', metavar='CORPUS_DIR',
+                        help="оценить распознавание на корпусе WAV и выйти")
+    # В Colab/Jupyter ядро передает свои аргументы (-f <kernel.json>)
+    args, _ = parser.parse_known_args()
+    
+    if args.evaluate:
+        VoiceDroneController().evaluate_recognition(args.evaluate)
+        sys.exit(0)
+    
     print("Запуск системы голосового управления квадрокоптером...")
     print("Версия с автоматическим скачиванием XML")
     print("=" * 60)
@@ -807,4 +2420,4 @@ if __name__ == "__main__":
     
     time.sleep(1)
     
-    main_menu()
+    main_menu(ActionProfiler(args.profile_dir) if args.profile else None)